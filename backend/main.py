@@ -1,12 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Optional, Any
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import ORJSONResponse
+from msgspec import Meta, Struct
+from typing import Annotated, Any, List, Dict, NamedTuple, Tuple
+import msgspec
 import numpy as np
+from numba import njit
+import os
+import random
+import re
 import time
 import logging
-import json
 from datetime import datetime
+from enum import Enum
+from functools import lru_cache
 
 # Configure logging
 logging.basicConfig(
@@ -21,7 +29,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="L2 Orderbook Trading Simulator API",
     description="API for simulating trading scenarios using L2 orderbook data",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -33,43 +42,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Maximum orderbook levels per side converted to arrays; the full request body
+# is still decoded, so decode time and memory grow with depth
+MAX_DEPTH = max(1, int(os.environ.get("ORDERBOOK_MAX_DEPTH", "50")))
+
 # Request and Response Models
-class OrderbookEntry(BaseModel):
-    price: float
-    size: float
-    total: Optional[float] = 0
-    percentage: Optional[float] = 0
-
-class OrderbookData(BaseModel):
-    bids: List[OrderbookEntry]
-    asks: List[OrderbookEntry]
+class OrderbookData(Struct, dict=True):
+    # Each side arrives as [price, size] pairs and its top MAX_DEPTH levels are
+    # repacked into a (2, N) float64 array: row 0 holds prices, row 1 holds sizes
+    bids: Annotated[List[Tuple[float, float]], Meta(min_length=1)]
+    asks: Annotated[List[Tuple[float, float]], Meta(min_length=1)]
     timestamp: int
 
-    @validator('bids', 'asks')
-    def validate_entries(cls, entries):
-        if not entries:
-            raise ValueError("Must contain at least one entry")
-        return entries
+    def __post_init__(self):
+        self._bid_levels = np.ascontiguousarray(np.asarray(self.bids[:MAX_DEPTH], dtype=np.float64).T)
+        self._ask_levels = np.ascontiguousarray(np.asarray(self.asks[:MAX_DEPTH], dtype=np.float64).T)
+        # Levels beyond MAX_DEPTH still count towards the exact total volume
+        self._bid_tail_volume = sum(size for _, size in self.bids[MAX_DEPTH:])
+        self._ask_tail_volume = sum(size for _, size in self.asks[MAX_DEPTH:])
+
+    @property
+    def bid_prices(self) -> np.ndarray:
+        return self._bid_levels[0]
+
+    @property
+    def bid_sizes(self) -> np.ndarray:
+        return self._bid_levels[1]
+
+    @property
+    def ask_prices(self) -> np.ndarray:
+        return self._ask_levels[0]
+
+    @property
+    def ask_sizes(self) -> np.ndarray:
+        return self._ask_levels[1]
+
+    @property
+    def total_volume(self) -> float:
+        return (_total_volume_kernel(self.bid_sizes, self.ask_sizes)
+                + self._bid_tail_volume + self._ask_tail_volume)
+
+class FeeTier(str, Enum):
+    VIP = "vip"
+    STANDARD = "standard"
+    BASIC = "basic"
 
-class SimulationParameters(BaseModel):
-    orderSize: float = Field(..., gt=0)
-    volatility: float = Field(..., ge=0, le=100)
-    feeTier: str = Field(..., regex='^(vip|standard|basic)$')
+class SimulationParameters(Struct):
+    orderSize: Annotated[float, Meta(gt=0)]
+    volatility: Annotated[float, Meta(ge=0, le=100)]
+    feeTier: FeeTier
 
-class SimulationRequest(BaseModel):
+class SimulationRequest(Struct):
     orderbookData: OrderbookData
     parameters: SimulationParameters
 
-class MakerTakerProportion(BaseModel):
+# Response models are immutable and hold no reference cycles, so they are
+# frozen and left untracked by the garbage collector
+class MakerTakerProportion(Struct, frozen=True, gc=False):
     maker: float
     taker: float
 
-class PerformanceMetrics(BaseModel):
+class PerformanceMetrics(Struct, frozen=True, gc=False):
     processingLatency: float
     uiUpdateLatency: float
     endToEndLatency: float
 
-class SimulationResponse(BaseModel):
+class SimulationResponse(Struct, frozen=True, gc=False):
     slippage: float
     fees: float
     marketImpact: float
@@ -78,145 +116,202 @@ class SimulationResponse(BaseModel):
     performanceMetrics: PerformanceMetrics
     timestamp: int
 
+_request_decoder = msgspec.json.Decoder(SimulationRequest)
+_response_encoder = msgspec.json.Encoder()
+
+# OpenAPI schemas for the msgspec models, since FastAPI can't derive them
+(_request_schema, _response_schema), _schema_components = msgspec.json.schema_components(
+    [SimulationRequest, SimulationResponse],
+    ref_template="#/components/schemas/{name}"
+)
+
+def custom_openapi() -> Dict[str, Any]:
+    if app.openapi_schema:
+        return app.openapi_schema
+    openapi_schema = get_openapi(
+        title=app.title,
+        version=app.version,
+        description=app.description,
+        routes=app.routes
+    )
+    openapi_schema.setdefault("components", {}).setdefault("schemas", {}).update(_schema_components)
+    app.openapi_schema = openapi_schema
+    return app.openapi_schema
+
+app.openapi = custom_openapi
+
+def _error_detail(error: msgspec.DecodeError) -> List[Dict[str, Any]]:
+    """
+    Convert a msgspec error into FastAPI's list-of-errors 422 detail
+    """
+    # msgspec reports the location as a suffix, e.g. " - at `$.orderbookData.bids[0]`"
+    message, _, path = str(error).partition(" - at `$")
+    loc: List[Any] = ["body"]
+    for key, index in re.findall(r"\.([^.\[`]+)|\[(\d+)\]", path):
+        loc.append(key if key else int(index))
+    error_type = "value_error" if isinstance(error, msgspec.ValidationError) else "json_invalid"
+    return [{"loc": loc, "msg": message, "type": error_type}]
+
+async def parse_simulation_request(request: Request) -> SimulationRequest:
+    """
+    Decode and validate the raw request body, bypassing Pydantic
+    """
+    try:
+        return _request_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=_error_detail(e))
+
+# Fee rates per tier
+_FEE_RATES: Dict[FeeTier, float] = {
+    FeeTier.VIP: 0.0002,       # 0.02%
+    FeeTier.STANDARD: 0.0005,  # 0.05%
+    FeeTier.BASIC: 0.001       # 0.1%
+}
+
+# Numeric Kernels
+@njit(cache=True, fastmath=True)
+def _total_volume_kernel(bid_sizes: np.ndarray, ask_sizes: np.ndarray) -> float:
+    total_volume = 0.0
+    for i in range(bid_sizes.size):
+        total_volume += bid_sizes[i]
+    for j in range(ask_sizes.size):
+        total_volume += ask_sizes[j]
+    return total_volume
+
+def _orderbook_costs(best_bid: float, best_ask: float, total_volume: float,
+                     order_size: float, volatility: float) -> Tuple[float, float, float]:
+    # Scalar-only math stays in plain Python; Numba's call dispatch would cost
+    # more than these few float operations
+    mid_price = (best_bid + best_ask) * 0.5
+    spread = best_ask - best_bid
+    sigma = volatility * 0.01  # Convert percentage to decimal
+    
+    # Simple slippage model: based on order size, volatility and spread
+    inv_mid = 1.0 / mid_price if mid_price else 0.0
+    slippage = order_size * volatility * spread * 1e-4 * inv_mid
+    
+    # Simplified Almgren-Chriss model over the total book depth
+    market_depth = total_volume if total_volume > 0 else 1.0
+    impact = (order_size / market_depth) * sigma * 0.1
+    return slippage, impact, mid_price
+
+@lru_cache(maxsize=1024)
+def _maker_taker_proportion(volatility_bp: int) -> Tuple[float, float]:
+    # Simplified logistic function based on volatility (in basis points)
+    # In a real implementation, this would use actual logistic regression
+    taker_proportion = min(0.9, volatility_bp / 10000)
+    return 1 - taker_proportion, taker_proportion
+
 # Simulation Models
-class TradingSimulator:
-    @staticmethod
-    def calculate_slippage(orderbook_data: OrderbookData, order_size: float, volatility: float) -> float:
-        """
-        Calculate expected slippage using a linear regression model
-        """
-        # Start timing
-        start_time = time.time()
-        
-        try:
-            # Extract bid and ask prices
-            bids = [entry.price for entry in orderbook_data.bids]
-            asks = [entry.price for entry in orderbook_data.asks]
-            
-            # Calculate mid price
-            mid_price = (bids[0] + asks[0]) / 2 if bids and asks else 0
-            
-            # Calculate spread
-            spread = asks[0] - bids[0] if bids and asks else 0
-            
-            # Simple slippage model: based on order size, volatility and spread
-            # In a real implementation, this would use more sophisticated regression
-            slippage = (order_size * volatility * spread) / (10000 * mid_price) if mid_price else 0
-            
-            logger.info(f"Calculated slippage: {slippage:.6f}")
-            return slippage
-            
-        except Exception as e:
-            logger.error(f"Error calculating slippage: {str(e)}")
-            return 0.0001  # Default fallback
-        finally:
-            logger.info(f"Slippage calculation took {(time.time() - start_time)*1000:.2f}ms")
+class OrderbookMetrics(NamedTuple):
+    slippage: float
+    market_impact: float
+    mid_price: float
+    total_volume: float
 
+class TradingSimulator:
     @staticmethod
-    def calculate_fees(order_size: float, fee_tier: str) -> float:
+    def calculate_fees(order_size: float, fee_tier: FeeTier) -> float:
         """
         Calculate expected fees based on fee tier
         """
-        fee_rates = {
-            "vip": 0.0002,      # 0.02%
-            "standard": 0.0005,  # 0.05%
-            "basic": 0.001       # 0.1%
-        }
-        
-        fee_rate = fee_rates.get(fee_tier, 0.001)  # Default to basic if tier not found
-        return order_size * fee_rate
+        return order_size * _FEE_RATES.get(fee_tier, 0.001)  # Default to basic if tier not found
 
     @staticmethod
-    def calculate_market_impact(orderbook_data: OrderbookData, order_size: float, volatility: float) -> float:
+    def compute_all(best_bid: float, best_ask: float, total_volume: float,
+                    order_size: float, volatility: float) -> OrderbookMetrics:
         """
-        Calculate market impact using simplified Almgren-Chriss model
+        Calculate slippage and market impact together from a book summary
         """
-        # Start timing
-        start_time = time.time()
-        
         try:
-            # Extract volumes
-            bid_volumes = [entry.size for entry in orderbook_data.bids]
-            ask_volumes = [entry.size for entry in orderbook_data.asks]
-            
-            # Calculate total volume
-            total_volume = sum(bid_volumes + ask_volumes)
-            
-            # Calculate market depth
-            market_depth = total_volume if total_volume > 0 else 1
-            
-            # Simplified Almgren-Chriss model
-            # In a real implementation, this would include more parameters
-            sigma = volatility / 100  # Convert percentage to decimal
-            impact = (order_size / market_depth) * sigma * 0.1
-            
-            logger.info(f"Calculated market impact: {impact:.6f}")
-            return impact
+            # In a real implementation, these would use more sophisticated models
+            slippage, impact, mid_price = _orderbook_costs(
+                best_bid,
+                best_ask,
+                total_volume,
+                order_size,
+                volatility
+            )
+            return OrderbookMetrics(slippage, impact, mid_price, total_volume)
             
         except Exception as e:
-            logger.error(f"Error calculating market impact: {str(e)}")
-            return 0.0002  # Default fallback
-        finally:
-            logger.info(f"Market impact calculation took {(time.time() - start_time)*1000:.2f}ms")
+            logger.error("Error calculating orderbook metrics: %s", e)
+            return OrderbookMetrics(0.0001, 0.0002, 0.0, total_volume)  # Default fallback
 
     @staticmethod
-    def calculate_maker_taker_proportion(volatility: float) -> Dict[str, float]:
+    def calculate_maker_taker_proportion(volatility: float) -> Tuple[float, float]:
         """
-        Calculate maker/taker proportion using logistic regression model
+        Calculate (maker, taker) proportion using logistic regression model
         """
-        # Simplified logistic function based on volatility
-        # In a real implementation, this would use actual logistic regression
-        taker_proportion = min(0.9, volatility / 100)
-        maker_proportion = 1 - taker_proportion
-        
-        return {"maker": maker_proportion, "taker": taker_proportion}
-
-@app.post("/simulate", response_model=SimulationResponse)
-async def simulate_trade(request: SimulationRequest) -> SimulationResponse:
-    # Start timing for end-to-end latency
-    start_time = time.time()
-    
+        # Volatility is quantized to 0.01% buckets so repeated readings hit the cache
+        return _maker_taker_proportion(round(volatility * 100))
+
+@lru_cache(maxsize=4096)
+def _simulate_core(best_bid: float, best_ask: float, total_volume: float, order_size: float,
+                   volatility: float, fee_tier: FeeTier) -> Tuple[float, float, float, float]:
+    """
+    Calculate (slippage, market impact, fees, net cost) for a book summary
+    """
+    metrics = TradingSimulator.compute_all(best_bid, best_ask, total_volume, order_size, volatility)
+    fees = TradingSimulator.calculate_fees(order_size, fee_tier)
+    return metrics.slippage, metrics.market_impact, fees, metrics.slippage + fees + metrics.market_impact
+
+@app.on_event("startup")
+async def warm_up_kernels():
+    # Trigger JIT compilation so the first request doesn't pay for it
+    sizes = np.ones(1, dtype=np.float64)
+    _total_volume_kernel(sizes, sizes)
+
+@app.post(
+    "/simulate",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _request_schema}}
+        }
+    },
+    responses={
+        200: {"content": {"application/json": {"schema": _response_schema}}}
+    }
+)
+def simulate_trade(request: SimulationRequest = Depends(parse_simulation_request)) -> Response:
     # Log request
-    logger.info(f"Received simulation request for order size: {request.parameters.orderSize}, volatility: {request.parameters.volatility}%")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Received simulation request for order size: %s, volatility: %s%%",
+            request.parameters.orderSize,
+            request.parameters.volatility
+        )
     
     # Process simulation
-    processing_start = time.time()
-    
-    # Calculate metrics
-    slippage = TradingSimulator.calculate_slippage(
-        request.orderbookData, 
-        request.parameters.orderSize,
-        request.parameters.volatility
-    )
+    processing_start = time.perf_counter_ns()
     
-    fees = TradingSimulator.calculate_fees(
+    # Calculate metrics; they depend only on the top of book and total volume,
+    # so repeated polls of an unchanged book are served from the cache
+    orderbook = request.orderbookData
+    total_volume = orderbook.total_volume
+    slippage, market_impact, fees, net_cost = _simulate_core(
+        float(orderbook.bid_prices[0]),
+        float(orderbook.ask_prices[0]),
+        total_volume,
         request.parameters.orderSize,
+        request.parameters.volatility,
         request.parameters.feeTier
     )
     
-    market_impact = TradingSimulator.calculate_market_impact(
-        request.orderbookData,
-        request.parameters.orderSize,
-        request.parameters.volatility
-    )
-    
-    maker_taker = TradingSimulator.calculate_maker_taker_proportion(
+    maker, taker = TradingSimulator.calculate_maker_taker_proportion(
         request.parameters.volatility
     )
     
-    # Calculate net cost
-    net_cost = slippage + fees + market_impact
-    
     # Calculate processing latency
-    processing_end = time.time()
-    processing_latency = (processing_end - processing_start) * 1000  # Convert to ms
+    processing_end = time.perf_counter_ns()
+    processing_latency = (processing_end - processing_start) / 1e6  # Convert ns to ms
     
     # Simulate UI update latency (in a real system this would be measured on the frontend)
-    ui_update_latency = np.random.normal(5, 1)  # Mean 5ms, std 1ms
+    ui_update_latency = random.gauss(5.0, 1.0)  # Mean 5ms, std 1ms
     
-    # Calculate end-to-end latency
-    end_time = time.time()
-    end_to_end_latency = (end_time - start_time) * 1000  # Convert to ms
+    # Calculate end-to-end latency from the single processing measurement
+    end_to_end_latency = processing_latency + ui_update_latency
     
     # Create response
     response = SimulationResponse(
@@ -225,21 +320,25 @@ async def simulate_trade(request: SimulationRequest) -> SimulationResponse:
         marketImpact=market_impact,
         netCost=net_cost,
         makerTakerProportion=MakerTakerProportion(
-            maker=maker_taker["maker"],
-            taker=maker_taker["taker"]
+            maker=maker,
+            taker=taker
         ),
         performanceMetrics=PerformanceMetrics(
             processingLatency=processing_latency,
             uiUpdateLatency=ui_update_latency,
             endToEndLatency=end_to_end_latency
         ),
-        timestamp=int(time.time() * 1000)
+        timestamp=time.time_ns() // 1_000_000
     )
     
     # Log response
-    logger.info(f"Simulation completed in {end_to_end_latency:.2f}ms with slippage: {slippage:.6f}, fees: {fees:.6f}, market impact: {market_impact:.6f}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Simulation completed in %.2fms with slippage: %.6f, fees: %.6f, market impact: %.6f",
+            end_to_end_latency, slippage, fees, market_impact
+        )
     
-    return response
+    return Response(content=_response_encoder.encode(response), media_type="application/json")
 
 @app.get("/health")
 async def health_check():
@@ -247,4 +346,13 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=max(1, (os.cpu_count() or 2) - 1),
+        log_level="warning",
+        access_log=False
+    )
@@ -35,14 +35,31 @@ export interface SimulationResponse {
   timestamp: number;
 }
 
+// Orderbook as sent to the backend: each side is a list of [price, size] pairs
+export interface OrderbookPayload {
+  bids: [number, number][];
+  asks: [number, number][];
+  timestamp: number;
+}
+
 export interface SimulationRequest {
-  orderbookData: OrderbookData;
+  orderbookData: OrderbookPayload;
   parameters: SimulationParameters;
 }
 
 // API URL - can be configured based on environment
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+/**
+ * Converts orderbook entries to the [price, size] pairs expected by the backend.
+ * Display-only fields (total, percentage) are not sent.
+ * @param entries Orderbook entries for one side of the book
+ * @returns Price/size pairs
+ */
+function toLevels(entries: OrderbookEntry[]): [number, number][] {
+  return entries.map((entry) => [entry.price, entry.size]);
+}
+
 /**
  * Sends a simulation request to the backend API
  * @param orderbookData Current orderbook data
@@ -62,7 +79,11 @@ export async function simulateTrade(
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        orderbookData,
+        orderbookData: {
+          bids: toLevels(orderbookData.bids),
+          asks: toLevels(orderbookData.asks),
+          timestamp: orderbookData.timestamp,
+        },
         parameters,
       } as SimulationRequest),
     });